@@ -1,29 +1,149 @@
-import asyncio
+import functools
+import hashlib
+import logging
+import logging.handlers
 import os
-from typing import List, Optional, Dict, Any, cast
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from pydantic import BaseModel
-from supabase import create_client, Client
-from dotenv import load_dotenv
+import queue
+import shutil
+import tempfile
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import (
+    AsyncIterator,
+    BinaryIO,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+    Dict,
+    Any,
+    cast,
+)
+import anyio.to_thread
+import httpx
+from fastapi import (
+    FastAPI,
+    UploadFile,
+    File,
+    Form,
+    HTTPException,
+    Depends,
+    Query,
+    Request,
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel, TypeAdapter
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from supabase import create_async_client, AsyncClient, AsyncClientOptions
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from starlette.background import BackgroundTask
 import uuid
 
-load_dotenv()
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-if not SUPABASE_URL or not SUPABASE_KEY:
-    print("CRITICAL ERROR: Environment variables not found.")
-    raise ValueError("Missing SUPABASE_URL or SUPABASE_KEY.")
+logger = logging.getLogger(__name__)
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-app = FastAPI()
+class Settings(BaseSettings):
+    # Anchored to this module, like load_dotenv()'s search, not the CWD.
+    model_config = SettingsConfigDict(env_file=Path(__file__).with_name(".env"))
+
+    SUPABASE_URL: str
+    SUPABASE_KEY: str
+    # Optional; response caching is disabled when unset.
+    REDIS_URL: Optional[str] = None
+
+
+@functools.lru_cache
+def settings() -> Settings:
+    return Settings()  # type: ignore[call-arg]
+
+
+# Cap on worker threads used by run_in_threadpool for blocking file I/O.
+THREADPOOL_LIMIT = 64
+
+
+def start_log_listener() -> (
+    Tuple[logging.handlers.QueueHandler, logging.handlers.QueueListener]
+):
+    """Route root logging through a queue drained by a background thread.
+
+    Handlers then never block the event loop on stream writes.
+    """
+    log_queue: queue.Queue = queue.Queue(-1)
+    handler = logging.StreamHandler()
+    handler.setFormatter(
+        logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    )
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    logging.getLogger().addHandler(queue_handler)
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    return queue_handler, listener
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_handler, log_listener = start_log_listener()
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_LIMIT
+
+    # One pooled keep-alive client per worker, shared by every Supabase
+    # service, so requests reuse connections instead of re-doing TLS.
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=100, max_keepalive_connections=50, keepalive_expiry=60
+        ),
+        timeout=httpx.Timeout(20.0),
+        http2=True,
+    )
+    config = settings()
+    app.state.http_client = http_client
+    app.state.supabase = await create_async_client(
+        config.SUPABASE_URL,
+        config.SUPABASE_KEY,
+        AsyncClientOptions(httpx_client=http_client),
+    )
+    app.state.photo_storage = PhotoStorage.from_settings(config)
+    redis_url = config.REDIS_URL
+    app.state.redis = (
+        Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        if redis_url
+        else None
+    )
+    yield
+    if app.state.redis is not None:
+        await app.state.redis.aclose()
+    await http_client.aclose()
+    logging.getLogger().removeHandler(log_handler)
+    log_listener.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def get_supabase(request: Request) -> AsyncClient:
+    return request.app.state.supabase
+
+
+def get_http_client(request: Request) -> httpx.AsyncClient:
+    return request.app.state.http_client
+
+
+def get_photo_storage(request: Request) -> "PhotoStorage":
+    return request.app.state.photo_storage
+
+
+def get_redis(request: Request) -> Optional[Redis]:
+    return request.app.state.redis
 
 
 # --- MODELS ---
 class VoteRequest(BaseModel):
-    photo_id: str
-    user_id: str
-    vote_type: str  # "up", "down", or "none"
+    photo_id: uuid.UUID
+    user_id: uuid.UUID
+    vote_type: Literal["up", "down", "none"]
 
 
 class PhotoResponse(BaseModel):
@@ -39,6 +159,189 @@ class PhotoResponse(BaseModel):
     user_vote: Optional[str] = None
 
 
+PHOTO_COLUMNS = ",".join(PhotoResponse.model_fields)
+PHOTOS_PAGE_SIZE = 50
+PHOTOS_MAX_PAGE_SIZE = 100
+
+PHOTOS_ADAPTER = TypeAdapter(List[PhotoResponse])
+
+
+def render_photos(rows: List[Dict[str, Any]]) -> bytes:
+    # Validate and serialize in pydantic-core in one pass, skipping FastAPI's
+    # per-item response_model handling.
+    return PHOTOS_ADAPTER.dump_json(PHOTOS_ADAPTER.validate_python(rows))
+
+
+# --- CACHE ---
+PHOTOS_CACHE_TTL = 60
+
+
+def location_scope(location_name: str) -> str:
+    return f"loc:{location_name}"
+
+
+def user_scope(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+def photos_cache_key(scope: str, version: int, params: Dict[str, Any]) -> str:
+    return f"photos:{scope}:v{version}:" + ":".join(
+        str(v or "") for v in params.values()
+    )
+
+
+# The cache fails open: Redis errors are logged and treated as a miss, so an
+# outage slows requests down rather than failing them.
+async def cache_get(redis: Optional[Redis], key: str) -> Optional[bytes]:
+    if redis is None:
+        return None
+    try:
+        return await redis.get(key)
+    except RedisError:
+        logger.warning("Cache read failed for %s", key, exc_info=True)
+        return None
+
+
+async def cache_set(redis: Optional[Redis], key: str, value: bytes, ttl: int) -> None:
+    if redis is None:
+        return
+    try:
+        await redis.set(key, value, ex=ttl)
+    except RedisError:
+        logger.warning("Cache write failed for %s", key, exc_info=True)
+
+
+# Each listing scope (a location, or a user's photos) has a version counter.
+# Writes bump it after they commit, and cached pages are keyed on it, so a
+# bump retires every cached page of that scope without scanning for them.
+async def cache_version(redis: Optional[Redis], scope: str) -> Optional[int]:
+    """Return the scope's current version, or None if caching is unavailable."""
+    if redis is None:
+        return None
+    try:
+        return int(await redis.get(f"ver:{scope}") or 0)
+    except RedisError:
+        logger.warning("Cache version read failed for %s", scope, exc_info=True)
+        return None
+
+
+async def bump_cache_versions(redis: Optional[Redis], *scopes: str) -> None:
+    if redis is None:
+        return
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            for scope in scopes:
+                pipe.incr(f"ver:{scope}")
+            await pipe.execute()
+    except RedisError:
+        logger.warning("Cache version bump failed for %s", scopes, exc_info=True)
+
+
+# --- STORAGE ---
+UPLOAD_CHUNK_SIZE = 1 << 20
+PHOTOS_BUCKET = "hotspot_photos"
+
+
+@dataclass(frozen=True)
+class PhotoStorage:
+    """Storage API endpoints and credentials for the photos bucket."""
+
+    upload_url: str
+    public_url: str
+    auth_headers: Dict[str, str]
+
+    @classmethod
+    def from_settings(cls, config: Settings) -> "PhotoStorage":
+        object_url = f"{config.SUPABASE_URL}/storage/v1/object"
+        return cls(
+            upload_url=f"{object_url}/{PHOTOS_BUCKET}/",
+            public_url=f"{object_url}/public/{PHOTOS_BUCKET}/",
+            auth_headers={
+                "Authorization": f"Bearer {config.SUPABASE_KEY}",
+                "apikey": config.SUPABASE_KEY,
+            },
+        )
+
+
+async def iter_file(file: BinaryIO) -> AsyncIterator[bytes]:
+    while chunk := await run_in_threadpool(file.read, UPLOAD_CHUNK_SIZE):
+        yield chunk
+
+
+async def upload_to_storage(
+    http_client: httpx.AsyncClient,
+    storage: PhotoStorage,
+    file_path: str,
+    file: BinaryIO,
+    content_type: str,
+    size: Optional[int] = None,
+) -> None:
+    # Stream the body to the Storage API in chunks rather than buffering the
+    # whole image; storage3's upload() only accepts bytes or real files.
+    headers = {**storage.auth_headers, "Content-Type": content_type}
+    if size is not None:
+        headers["Content-Length"] = str(size)
+
+    response = await http_client.post(
+        storage.upload_url + file_path,
+        content=iter_file(file),
+        headers=headers,
+    )
+    response.raise_for_status()
+
+
+async def remove_from_storage(
+    http_client: httpx.AsyncClient, storage: PhotoStorage, file_path: str
+) -> None:
+    try:
+        response = await http_client.delete(
+            storage.upload_url + file_path, headers=storage.auth_headers
+        )
+        response.raise_for_status()
+    except httpx.HTTPError:
+        logger.exception("Failed to remove orphaned upload %s", file_path)
+
+
+async def persist_photo(
+    supabase: AsyncClient,
+    http_client: httpx.AsyncClient,
+    storage: PhotoStorage,
+    redis: Optional[Redis],
+    file_path: str,
+    file: BinaryIO,
+    content_type: str,
+    size: Optional[int],
+    new_photo: Dict[str, Any],
+) -> None:
+    """Store an accepted upload and its photos row; runs after the 202 is sent."""
+    # Upload first so a row never points at an image that failed to store.
+    try:
+        await upload_to_storage(
+            http_client, storage, file_path, file, content_type, size
+        )
+    except Exception:
+        logger.exception("Upload error")
+        return
+    finally:
+        file.close()
+
+    try:
+        response = await supabase.table("photos").insert(new_photo).execute()
+        if not response.data:
+            raise RuntimeError("Database insert returned no data.")
+    except Exception:
+        logger.exception("Upload error")
+        # No row will ever reference the stored image, so don't leave it behind.
+        await remove_from_storage(http_client, storage, file_path)
+        return
+
+    await bump_cache_versions(
+        redis,
+        location_scope(new_photo["location_name"]),
+        user_scope(new_photo["user_id"]),
+    )
+
+
 @app.get("/")
 async def health_check():
     return {"status": "ok", "message": "Hotspot Backend is running"}
@@ -46,33 +349,32 @@ async def health_check():
 
 @app.post("/upload")
 async def upload_photo(
-    user_id: str = Form(...),
+    user_id: uuid.UUID = Form(...),
     location_name: str = Form(...),
     title: str = Form(...),
     description: str = Form(...),
     latitude: float = Form(...),
     longitude: float = Form(...),
     file: UploadFile = File(...),
+    supabase: AsyncClient = Depends(get_supabase),
+    http_client: httpx.AsyncClient = Depends(get_http_client),
+    storage: PhotoStorage = Depends(get_photo_storage),
+    redis: Optional[Redis] = Depends(get_redis),
 ):
     try:
         if not file.filename:
             raise HTTPException(status_code=400, detail="File must have a filename")
 
-        file_ext = file.filename.split(".")[-1]
-        file_name = f"{uuid.uuid4()}.{file_ext}"
+        photo_id = uuid.uuid4()
+        file_ext = os.path.splitext(file.filename)[1]  # includes the dot
+        file_name = f"{photo_id.hex}{file_ext}"
         file_path = f"uploads/{file_name}"
 
-        file_content = await file.read()
-        content_type = file.content_type or "application/octet-stream"
-
-        supabase.storage.from_("hotspot_photos").upload(
-            file_path, file_content, {"content-type": content_type}
-        )
-
-        public_url = supabase.storage.from_("hotspot_photos").get_public_url(file_path)
+        public_url = storage.public_url + file_path
 
         new_photo = {
-            "user_id": user_id,
+            "id": str(photo_id),
+            "user_id": str(user_id),
             "location_name": location_name,
             "image_url": public_url,
             "title": title,
@@ -81,164 +383,197 @@ async def upload_photo(
             "longitude": longitude,
         }
 
-        response = supabase.table("photos").insert(new_photo).execute()
-
-        data = cast(List[Dict[str, Any]], response.data)
-
-        if not data:
-            print("Error: Database insert returned no data.")
-            raise HTTPException(status_code=500, detail="Database insert failed.")
+        content_type = file.content_type or "application/octet-stream"
 
-        return {"status": "success", "photo": data[0]}
+        # The request's UploadFile is closed once the handler returns, so the
+        # background task gets its own spooled copy of the body.
+        spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_CHUNK_SIZE)
+        try:
+            await run_in_threadpool(shutil.copyfileobj, file.file, spool)
+            spool.seek(0)
+            background = BackgroundTask(
+                persist_photo,
+                supabase,
+                http_client,
+                storage,
+                redis,
+                file_path,
+                spool,
+                content_type,
+                file.size,
+                new_photo,
+            )
+        except BaseException:
+            spool.close()
+            raise
+
+        return JSONResponse(
+            {"status": "accepted", "photo": new_photo},
+            status_code=202,
+            background=background,
+        )
 
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Upload Error: {e}")
+        logger.exception("Upload error")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def page_cursor(
+    cursor: Optional[datetime] = None, cursor_id: Optional[uuid.UUID] = None
+) -> Optional[Tuple[datetime, uuid.UUID]]:
+    """Keyset cursor for the list endpoints: the last photo's created_at and id.
+
+    Both halves are required; created_at alone would skip photos sharing it.
+    """
+    if cursor is None and cursor_id is None:
+        return None
+    if cursor is None or cursor_id is None:
+        raise HTTPException(
+            status_code=422, detail="cursor and cursor_id must be given together"
+        )
+    return cursor, cursor_id
+
+
+def photos_page_params(
+    viewer_id: Optional[uuid.UUID],
+    limit: int,
+    cursor: Optional[Tuple[datetime, uuid.UUID]],
+    location_name: Optional[str] = None,
+    user_id: Optional[uuid.UUID] = None,
+) -> Dict[str, Any]:
+    return {
+        "p_viewer": str(viewer_id) if viewer_id else None,
+        "p_location": location_name,
+        "p_user": str(user_id) if user_id else None,
+        "p_limit": limit,
+        "p_cursor": cursor[0].isoformat() if cursor else None,
+        "p_cursor_id": str(cursor[1]) if cursor else None,
+    }
+
+
+async def fetch_photos_page(supabase: AsyncClient, params: Dict[str, Any]) -> bytes:
+    response = await supabase.rpc("photos_page", params).select(PHOTO_COLUMNS).execute()
+
+    return render_photos(cast(List[Dict[str, Any]], response.data))
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (t.strip().removeprefix("W/") for t in if_none_match.split(","))
+
+
+async def photos_page_response(
+    request: Request,
+    supabase: AsyncClient,
+    redis: Optional[Redis],
+    scope: str,
+    params: Dict[str, Any],
+) -> Response:
+    # Read the version before the page so a write that lands in between
+    # can only leave a newer body under an already-retired key.
+    version = await cache_version(redis, scope)
+    cache_key = (
+        photos_cache_key(scope, version, params) if version is not None else None
+    )
+    body = await cache_get(redis, cache_key) if cache_key else None
+    if body is None:
+        body = await fetch_photos_page(supabase, params)
+        if cache_key:
+            await cache_set(redis, cache_key, body, PHOTOS_CACHE_TTL)
+
+    # The tag is a digest of the rendered page, so it always matches the body
+    # it is sent with and costs no extra round trip.
+    etag = f'"{hashlib.md5(body, usedforsecurity=False).hexdigest()}"'
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+
+# Listings are newest first. To get the next page, pass the last photo's
+# created_at as `cursor` and its id as `cursor_id`.
 @app.get("/locations/{location_name}/photos", response_model=List[PhotoResponse])
-async def get_location_photos(location_name: str, viewer_id: Optional[str] = None):
+async def get_location_photos(
+    request: Request,
+    location_name: str,
+    viewer_id: Optional[uuid.UUID] = None,
+    limit: int = Query(PHOTOS_PAGE_SIZE, ge=1, le=PHOTOS_MAX_PAGE_SIZE),
+    cursor: Optional[Tuple[datetime, uuid.UUID]] = Depends(page_cursor),
+    supabase: AsyncClient = Depends(get_supabase),
+    redis: Optional[Redis] = Depends(get_redis),
+):
     try:
-        response = (
-            supabase.table("photos")
-            .select("*")
-            .eq("location_name", location_name)
-            .order("created_at", desc=True)
-            .execute()
+        params = photos_page_params(
+            viewer_id, limit, cursor, location_name=location_name
+        )
+        return await photos_page_response(
+            request, supabase, redis, location_scope(location_name), params
         )
-
-        photos = cast(List[Dict[str, Any]], response.data)
-
-        if viewer_id and photos:
-            photo_ids = [p["id"] for p in photos]
-
-            votes_response = (
-                supabase.table("votes")
-                .select("photo_id, vote_type")
-                .eq("user_id", viewer_id)
-                .in_("photo_id", photo_ids)
-                .execute()
-            )
-
-            votes_data = cast(List[Dict[str, Any]], votes_response.data)
-            vote_map = {v["photo_id"]: v["vote_type"] for v in votes_data}
-
-            for photo in photos:
-                photo["user_vote"] = vote_map.get(photo["id"])
-
-        return photos
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/users/{user_id}/photos", response_model=List[PhotoResponse])
-async def get_user_photos(user_id: str, viewer_id: Optional[str] = None):
+async def get_user_photos(
+    request: Request,
+    user_id: uuid.UUID,
+    viewer_id: Optional[uuid.UUID] = None,
+    limit: int = Query(PHOTOS_PAGE_SIZE, ge=1, le=PHOTOS_MAX_PAGE_SIZE),
+    cursor: Optional[Tuple[datetime, uuid.UUID]] = Depends(page_cursor),
+    supabase: AsyncClient = Depends(get_supabase),
+    redis: Optional[Redis] = Depends(get_redis),
+):
     try:
-        response = (
-            supabase.table("photos")
-            .select("*")
-            .eq("user_id", user_id)
-            .order("created_at", desc=True)
-            .execute()
+        params = photos_page_params(viewer_id, limit, cursor, user_id=user_id)
+        return await photos_page_response(
+            request, supabase, redis, user_scope(str(user_id)), params
         )
-
-        photos = cast(List[Dict[str, Any]], response.data)
-
-        if viewer_id and photos:
-            photo_ids = [p["id"] for p in photos]
-
-            votes_response = (
-                supabase.table("votes")
-                .select("photo_id, vote_type")
-                .eq("user_id", viewer_id)
-                .in_("photo_id", photo_ids)
-                .execute()
-            )
-
-            votes_data = cast(List[Dict[str, Any]], votes_response.data)
-            vote_map = {v["photo_id"]: v["vote_type"] for v in votes_data}
-
-            for photo in photos:
-                photo["user_vote"] = vote_map.get(photo["id"])
-
-        return photos
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/vote")
-async def vote_photo(vote: VoteRequest):
+async def vote_photo(
+    vote: VoteRequest,
+    supabase: AsyncClient = Depends(get_supabase),
+    redis: Optional[Redis] = Depends(get_redis),
+):
     try:
-        existing = (
-            supabase.table("votes")
-            .select("*")
-            .eq("user_id", vote.user_id)
-            .eq("photo_id", vote.photo_id)
-            .execute()
-        )
-
-        existing_data = cast(List[Dict[str, Any]], existing.data)
-        existing_vote_type = existing_data[0]["vote_type"] if existing_data else None
-
-        photo_res = (
-            supabase.table("photos")
-            .select("upvotes, downvotes")
-            .eq("id", vote.photo_id)
-            .execute()
-        )
+        response = await supabase.rpc(
+            "cast_vote",
+            {
+                "p_user": str(vote.user_id),
+                "p_photo": str(vote.photo_id),
+                "p_type": vote.vote_type,
+            },
+        ).execute()
 
-        photo_data = cast(List[Dict[str, Any]], photo_res.data)
+        tallies = cast(List[Dict[str, Any]], response.data)
 
-        if not photo_data:
+        if not tallies:
             raise HTTPException(status_code=404, detail="Photo not found")
 
-        photo = photo_data[0]
-
-        up = int(photo.get("upvotes", 0))
-        down = int(photo.get("downvotes", 0))
-
-        if vote.vote_type == "none":
-            if existing_vote_type == "up":
-                up -= 1
-            elif existing_vote_type == "down":
-                down -= 1
-
-            if existing_vote_type:
-                supabase.table("votes").delete().eq("user_id", vote.user_id).eq(
-                    "photo_id", vote.photo_id
-                ).execute()
-
-        else:
-            if existing_vote_type == "up":
-                up -= 1
-            elif existing_vote_type == "down":
-                down -= 1
-
-            if vote.vote_type == "up":
-                up += 1
-            elif vote.vote_type == "down":
-                down += 1
-
-            vote_data = {
-                "user_id": vote.user_id,
-                "photo_id": vote.photo_id,
-                "vote_type": vote.vote_type,
-            }
-            supabase.table("votes").upsert(
-                vote_data, on_conflict="user_id, photo_id"
-            ).execute()
-
-        supabase.table("photos").update({"upvotes": up, "downvotes": down}).eq(
-            "id", vote.photo_id
-        ).execute()
+        await bump_cache_versions(
+            redis,
+            location_scope(tallies[0]["location_name"]),
+            user_scope(tallies[0]["owner_id"]),
+        )
 
         return {
             "status": "success",
             "vote": vote.vote_type,
-            "new_up": up,
-            "new_down": down,
+            "new_up": tallies[0]["upvotes"],
+            "new_down": tallies[0]["downvotes"],
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Vote Error: {e}")
+        logger.exception("Vote error")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,50 @@
+-- Apply a user's vote to a photo and return the photo's updated tallies.
+--
+-- Called from POST /vote via supabase.rpc("cast_vote", ...). Doing the vote
+-- bookkeeping here keeps it to a single round trip and a single transaction,
+-- so concurrent voters can no longer overwrite each other's counts.
+create or replace function public.cast_vote(p_user uuid, p_photo uuid, p_type text)
+returns table (upvotes integer, downvotes integer)
+language plpgsql
+as $$
+#variable_conflict use_column
+declare
+    old_type text;
+    delta_up integer;
+    delta_down integer;
+begin
+    if p_type not in ('up', 'down', 'none') then
+        raise exception 'invalid vote_type: %', p_type using errcode = '22023';
+    end if;
+
+    -- Serialize votes on the same photo; an unknown photo yields no rows.
+    perform 1 from photos p where p.id = p_photo for update;
+    if not found then
+        return;
+    end if;
+
+    select v.vote_type into old_type
+    from votes v
+    where v.user_id = p_user and v.photo_id = p_photo;
+
+    if p_type = 'none' then
+        delete from votes v where v.user_id = p_user and v.photo_id = p_photo;
+    else
+        insert into votes (user_id, photo_id, vote_type)
+        values (p_user, p_photo, p_type)
+        on conflict (user_id, photo_id) do update set vote_type = excluded.vote_type;
+    end if;
+
+    delta_up := case when p_type = 'up' then 1 else 0 end
+              - case when old_type = 'up' then 1 else 0 end;
+    delta_down := case when p_type = 'down' then 1 else 0 end
+                - case when old_type = 'down' then 1 else 0 end;
+
+    return query
+        update photos p
+        set upvotes = p.upvotes + delta_up,
+            downvotes = p.downvotes + delta_down
+        where p.id = p_photo
+        returning p.upvotes, p.downvotes;
+end;
+$$;
@@ -0,0 +1,40 @@
+-- Photos annotated with the viewer's own vote on each one.
+--
+-- Used by the photo list endpoints via supabase.rpc("photos_with_vote", ...)
+-- with PostgREST filters and ordering applied on top. Being a plain, stable
+-- SQL function it is inlined by the planner, so those filters reach the
+-- photos indexes instead of running over the whole table.
+create or replace function public.photos_with_vote(p_viewer uuid default null)
+returns table (
+    id uuid,
+    user_id uuid,
+    location_name text,
+    image_url text,
+    title text,
+    description text,
+    latitude double precision,
+    longitude double precision,
+    upvotes integer,
+    downvotes integer,
+    created_at timestamptz,
+    user_vote text
+)
+language sql
+stable
+as $$
+    select
+        p.id,
+        p.user_id,
+        p.location_name,
+        p.image_url,
+        p.title,
+        p.description,
+        p.latitude,
+        p.longitude,
+        p.upvotes,
+        p.downvotes,
+        p.created_at,
+        v.vote_type as user_vote
+    from photos p
+    left join votes v on v.photo_id = p.id and v.user_id = p_viewer;
+$$;
@@ -0,0 +1,55 @@
+-- Collapse cast_vote's read / delete-or-upsert / update sequence into one
+-- data-modifying statement. The previous vote is read, the votes row is
+-- written and the tallies are adjusted in a single pass.
+
+create or replace function public.cast_vote(p_user uuid, p_photo uuid, p_type text)
+returns table (upvotes integer, downvotes integer, location_name text)
+language plpgsql
+as $$
+#variable_conflict use_column
+begin
+    if p_type not in ('up', 'down', 'none') then
+        raise exception 'invalid vote_type: %', p_type using errcode = '22023';
+    end if;
+
+    -- Serialize votes on the same photo; an unknown photo yields no rows. The
+    -- statement below takes a fresh snapshot, so it sees any vote committed
+    -- while we waited for the lock.
+    perform 1 from photos p where p.id = p_photo for update;
+    if not found then
+        return;
+    end if;
+
+    return query
+        with prev as (
+            select v.vote_type
+            from votes v
+            where v.user_id = p_user and v.photo_id = p_photo
+        ),
+        removed as (
+            delete from votes v
+            where v.user_id = p_user and v.photo_id = p_photo and p_type = 'none'
+        ),
+        upserted as (
+            insert into votes (user_id, photo_id, vote_type)
+            select p_user, p_photo, p_type
+            where p_type <> 'none'
+            on conflict (user_id, photo_id) do update set vote_type = excluded.vote_type
+        ),
+        delta as (
+            -- Each side contributes 1 to the tally it names; 'none' and a
+            -- missing previous vote contribute nothing.
+            select
+                (p_type = 'up')::integer
+                    - coalesce((select prev.vote_type = 'up' from prev), false)::integer as up,
+                (p_type = 'down')::integer
+                    - coalesce((select prev.vote_type = 'down' from prev), false)::integer as down
+        )
+        update photos p
+        set upvotes = p.upvotes + delta.up,
+            downvotes = p.downvotes + delta.down
+        from delta
+        where p.id = p_photo
+        returning p.upvotes, p.downvotes, p.location_name;
+end;
+$$;
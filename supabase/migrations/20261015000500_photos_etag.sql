@@ -0,0 +1,27 @@
+-- Version tag for a photo listing, used as the ETag of the list endpoints.
+--
+-- Changes whenever a photo in the listing is added or removed, its tallies
+-- move, or the viewer's own votes on it change. The API compares it
+-- against If-None-Match before fetching and serializing the listing.
+create or replace function public.photos_etag(
+    p_viewer uuid default null,
+    p_location text default null,
+    p_user uuid default null
+)
+returns text
+language sql
+stable
+as $$
+    select md5(concat_ws(
+        ':',
+        max(created_at),
+        count(*),
+        sum(upvotes),
+        sum(downvotes),
+        count(*) filter (where user_vote = 'up'),
+        count(*) filter (where user_vote = 'down')
+    ))
+    from photos_with_vote(p_viewer)
+    where (p_location is null or location_name = p_location)
+      and (p_user is null or user_id = p_user);
+$$;
@@ -0,0 +1,22 @@
+-- Hash each photo's state into photos_etag instead of listing-wide sums.
+--
+-- Sums let offsetting changes (one photo losing an upvote while another
+-- gains one) produce the same tag. The per-row digest changes whenever any
+-- photo's tallies or the viewer's vote on it change.
+create or replace function public.photos_etag(
+    p_viewer uuid default null,
+    p_location text default null,
+    p_user uuid default null
+)
+returns text
+language sql
+stable
+as $$
+    select md5(coalesce(string_agg(
+        id || ':' || upvotes || ':' || downvotes || ':' || coalesce(user_vote, ''),
+        ',' order by created_at desc, id
+    ), ''))
+    from photos_with_vote(p_viewer)
+    where (p_location is null or location_name = p_location)
+      and (p_user is null or user_id = p_user);
+$$;
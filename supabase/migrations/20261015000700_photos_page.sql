@@ -0,0 +1,83 @@
+-- One page of a photo listing, newest first, with the viewer's vote.
+--
+-- Pages are keyed on (created_at, id): pass the last row's created_at as
+-- p_cursor and its id as p_cursor_id to get the next page. With only
+-- p_cursor, rows sharing that exact timestamp are skipped.
+create or replace function public.photos_page(
+    p_viewer uuid default null,
+    p_location text default null,
+    p_user uuid default null,
+    p_limit integer default 50,
+    p_cursor timestamptz default null,
+    p_cursor_id uuid default null
+)
+returns table (
+    id uuid,
+    user_id uuid,
+    location_name text,
+    image_url text,
+    title text,
+    description text,
+    latitude double precision,
+    longitude double precision,
+    upvotes integer,
+    downvotes integer,
+    created_at timestamptz,
+    user_vote text
+)
+language sql
+stable
+as $$
+    select
+        p.id,
+        p.user_id,
+        p.location_name,
+        p.image_url,
+        p.title,
+        p.description,
+        p.latitude,
+        p.longitude,
+        p.upvotes,
+        p.downvotes,
+        p.created_at,
+        p.user_vote
+    from photos_with_vote(p_viewer) p
+    where (p_location is null or p.location_name = p_location)
+      and (p_user is null or p.user_id = p_user)
+      and (
+          p_cursor is null
+          or p.created_at < p_cursor
+          or (p_cursor_id is not null and p.created_at = p_cursor and p.id < p_cursor_id)
+      )
+    order by p.created_at desc, p.id desc
+    limit p_limit;
+$$;
+
+create index if not exists photos_location_created_at_id_idx
+    on photos (location_name, created_at desc, id desc);
+
+create index if not exists photos_user_created_at_id_idx
+    on photos (user_id, created_at desc, id desc);
+
+-- Tag only the requested page rather than the whole listing, so a request
+-- for one page never scans every photo at a popular location.
+drop function if exists public.photos_etag(uuid, text, uuid);
+
+create function public.photos_etag(
+    p_viewer uuid default null,
+    p_location text default null,
+    p_user uuid default null,
+    p_limit integer default 50,
+    p_cursor timestamptz default null,
+    p_cursor_id uuid default null
+)
+returns text
+language sql
+stable
+as $$
+    select md5(coalesce(string_agg(
+        id || ':' || upvotes || ':' || downvotes || ':' || coalesce(user_vote, ''),
+        ',' order by created_at desc, id desc
+    ), ''))
+    from photos_page(p_viewer, p_location, p_user, p_limit, p_cursor, p_cursor_id);
+$$;
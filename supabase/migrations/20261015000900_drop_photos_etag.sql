@@ -0,0 +1,3 @@
+-- The list endpoints now hash the page they already fetched to build the
+-- ETag, so the separate tag query is no longer called.
+drop function if exists public.photos_etag(uuid, text, uuid, integer, timestamptz, uuid);
@@ -0,0 +1,93 @@
+import asyncio
+import os
+
+import fakeredis
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from supabase import AsyncClientOptions, create_async_client
+
+os.environ.setdefault("SUPABASE_URL", "http://supabase.test")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+
+import main  # noqa: E402
+
+SUPABASE_URL = "http://supabase.test"
+
+PHOTO_ROW = {
+    "id": "5f0c3a52-6a3e-4d38-9d0e-3c1bb8a3f6a1",
+    "user_id": "0b9d6a0e-1f62-4f44-9a43-8f1f2b5c7d10",
+    "location_name": "pier",
+    "image_url": "http://supabase.test/storage/v1/object/public/hotspot_photos/x.jpg",
+    "title": "Sunset",
+    "description": "From the pier",
+    "upvotes": 3,
+    "downvotes": 1,
+    "created_at": "2026-10-01T12:00:00+00:00",
+    "user_vote": None,
+}
+
+
+class FakeSupabase:
+    """Routes Supabase and Storage HTTP calls to canned responses."""
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        for path, handler in self.routes.items():
+            if request.url.path.endswith(path):
+                return handler(request)
+        return httpx.Response(200, json={})
+
+    def calls(self, path: str):
+        return [r for r in self.requests if r.url.path.endswith(path)]
+
+
+@pytest.fixture
+def fake_supabase():
+    fake = FakeSupabase()
+    fake.routes["/rpc/photos_page"] = lambda r: httpx.Response(200, json=[PHOTO_ROW])
+    return fake
+
+
+@pytest.fixture
+def http_client(fake_supabase):
+    return httpx.AsyncClient(transport=httpx.MockTransport(fake_supabase))
+
+
+@pytest.fixture
+def supabase(http_client):
+    return asyncio.run(
+        create_async_client(
+            SUPABASE_URL, "test-key", AsyncClientOptions(httpx_client=http_client)
+        )
+    )
+
+
+@pytest.fixture
+def storage():
+    return main.PhotoStorage.from_settings(
+        main.Settings(SUPABASE_URL=SUPABASE_URL, SUPABASE_KEY="test-key")
+    )
+
+
+@pytest.fixture
+def redis():
+    return fakeredis.FakeAsyncRedis()
+
+
+@pytest.fixture
+def client(supabase, http_client, storage, redis):
+    overrides = {
+        main.get_supabase: lambda: supabase,
+        main.get_http_client: lambda: http_client,
+        main.get_photo_storage: lambda: storage,
+        main.get_redis: lambda: redis,
+    }
+    main.app.dependency_overrides.update(overrides)
+    with TestClient(main.app) as test_client:
+        yield test_client
+    main.app.dependency_overrides.clear()
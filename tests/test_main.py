@@ -0,0 +1,243 @@
+import io
+import json
+import uuid
+
+import fakeredis
+import httpx
+import pytest
+
+import main
+from conftest import PHOTO_ROW
+
+USER_ID = "0b9d6a0e-1f62-4f44-9a43-8f1f2b5c7d10"
+PHOTO_ID = "5f0c3a52-6a3e-4d38-9d0e-3c1bb8a3f6a1"
+NEW_PHOTO = {"id": PHOTO_ID, "user_id": USER_ID, "location_name": "pier"}
+
+
+# --- ETAG ---
+def test_listing_sets_etag_and_returns_page(client):
+    response = client.get("/locations/pier/photos")
+
+    assert response.status_code == 200
+    assert response.json() == [PHOTO_ROW]
+    assert response.headers["etag"].startswith('"')
+
+
+@pytest.mark.parametrize(
+    "if_none_match",
+    [
+        "{etag}",
+        "W/{etag}",
+        '"stale", {etag}',
+        '"stale",W/{etag}',
+        "*",
+    ],
+)
+def test_matching_if_none_match_returns_304(client, if_none_match):
+    etag = client.get("/locations/pier/photos").headers["etag"]
+
+    response = client.get(
+        "/locations/pier/photos",
+        headers={"If-None-Match": if_none_match.format(etag=etag)},
+    )
+
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+
+def test_stale_if_none_match_returns_page(client):
+    response = client.get(
+        "/locations/pier/photos", headers={"If-None-Match": '"stale", W/"older"'}
+    )
+
+    assert response.status_code == 200
+    assert response.json() == [PHOTO_ROW]
+
+
+# --- CACHE ---
+def test_cached_page_skips_supabase(client, fake_supabase):
+    first = client.get("/locations/pier/photos")
+    second = client.get("/locations/pier/photos")
+
+    assert second.content == first.content
+    assert len(fake_supabase.calls("/rpc/photos_page")) == 1
+
+
+def test_vote_invalidates_cached_pages(client, fake_supabase):
+    fake_supabase.routes["/rpc/cast_vote"] = lambda r: httpx.Response(
+        200,
+        json=[
+            {
+                "upvotes": 4,
+                "downvotes": 1,
+                "location_name": "pier",
+                "owner_id": USER_ID,
+            }
+        ],
+    )
+    client.get("/locations/pier/photos")
+    client.get(f"/users/{USER_ID}/photos")
+
+    client.post(
+        "/vote", json={"photo_id": PHOTO_ID, "user_id": USER_ID, "vote_type": "up"}
+    )
+    client.get("/locations/pier/photos")
+    client.get(f"/users/{USER_ID}/photos")
+
+    assert len(fake_supabase.calls("/rpc/photos_page")) == 4
+
+
+@pytest.mark.asyncio
+async def test_cache_helpers_fail_open_on_redis_error():
+    redis = fakeredis.FakeAsyncRedis(connected=False)
+
+    assert await main.cache_get(redis, "photos:loc:pier") is None
+    await main.cache_set(redis, "photos:loc:pier", b"[]", main.PHOTOS_CACHE_TTL)
+    assert await main.cache_version(redis, "loc:pier") is None
+    await main.bump_cache_versions(redis, "loc:pier", f"user:{USER_ID}")
+
+
+def test_listing_served_when_redis_is_down(client, redis, fake_supabase):
+    redis.connected = False
+
+    response = client.get("/locations/pier/photos")
+
+    assert response.status_code == 200
+    assert response.json() == [PHOTO_ROW]
+    assert len(fake_supabase.calls("/rpc/photos_page")) == 1
+
+
+# --- CURSOR ---
+@pytest.mark.parametrize(
+    "query",
+    [
+        "cursor=2026-10-01T12:00:00Z",
+        f"cursor_id={PHOTO_ID}",
+        f"cursor=yesterday&cursor_id={PHOTO_ID}",
+        "cursor=2026-10-01T12:00:00Z&cursor_id=abc",
+    ],
+)
+def test_invalid_cursor_returns_422(client, fake_supabase, query):
+    response = client.get(f"/locations/pier/photos?{query}")
+
+    assert response.status_code == 422
+    assert not fake_supabase.calls("/rpc/photos_page")
+
+
+def test_cursor_is_passed_to_photos_page(client, fake_supabase):
+    response = client.get(
+        f"/locations/pier/photos?cursor=2026-10-01T12:00:00Z&cursor_id={PHOTO_ID}"
+    )
+
+    assert response.status_code == 200
+    (call,) = fake_supabase.calls("/rpc/photos_page")
+    params = json.loads(call.content)
+    assert params["p_cursor"] == "2026-10-01T12:00:00+00:00"
+    assert params["p_cursor_id"] == PHOTO_ID
+
+
+# --- VOTE ---
+def test_vote_on_missing_photo_returns_404(client, fake_supabase):
+    fake_supabase.routes["/rpc/cast_vote"] = lambda r: httpx.Response(200, json=[])
+
+    response = client.post(
+        "/vote", json={"photo_id": PHOTO_ID, "user_id": USER_ID, "vote_type": "up"}
+    )
+
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"photo_id": PHOTO_ID, "user_id": USER_ID, "vote_type": "sideways"},
+        {"photo_id": "not-a-uuid", "user_id": USER_ID, "vote_type": "up"},
+        {"photo_id": PHOTO_ID, "user_id": "42", "vote_type": "down"},
+    ],
+)
+def test_invalid_vote_returns_422(client, fake_supabase, body):
+    response = client.post("/vote", json=body)
+
+    assert response.status_code == 422
+    assert not fake_supabase.calls("/rpc/cast_vote")
+
+
+# --- UPLOAD ---
+def upload_form():
+    return {
+        "data": {
+            "user_id": USER_ID,
+            "location_name": "pier",
+            "title": "Sunset",
+            "description": "From the pier",
+            "latitude": "51.5",
+            "longitude": "-0.1",
+        },
+        "files": {"file": ("sunset.jpg", b"\xff\xd8image", "image/jpeg")},
+    }
+
+
+def test_upload_returns_202_and_stores_photo(client, fake_supabase):
+    fake_supabase.routes["/rest/v1/photos"] = lambda r: httpx.Response(
+        201, json=[PHOTO_ROW]
+    )
+
+    response = client.post("/upload", **upload_form())
+
+    assert response.status_code == 202
+    photo = response.json()["photo"]
+    assert response.json()["status"] == "accepted"
+    assert photo["user_id"] == USER_ID
+    file_name = f"{uuid.UUID(photo['id']).hex}.jpg"
+    (stored,) = fake_supabase.calls(f"/hotspot_photos/uploads/{file_name}")
+    assert stored.method == "POST"
+    assert stored.content == b"\xff\xd8image"
+    assert len(fake_supabase.calls("/rest/v1/photos")) == 1
+
+
+@pytest.mark.asyncio
+async def test_persist_photo_closes_spool_when_upload_fails(
+    supabase, http_client, storage, fake_supabase
+):
+    fake_supabase.routes["/uploads/x.jpg"] = lambda r: httpx.Response(500)
+    spool = io.BytesIO(b"image")
+
+    await main.persist_photo(
+        supabase,
+        http_client,
+        storage,
+        None,
+        "uploads/x.jpg",
+        spool,
+        "image/jpeg",
+        5,
+        NEW_PHOTO,
+    )
+
+    assert spool.closed
+    assert not fake_supabase.calls("/rest/v1/photos")
+
+
+@pytest.mark.asyncio
+async def test_persist_photo_removes_image_when_insert_fails(
+    supabase, http_client, storage, fake_supabase
+):
+    fake_supabase.routes["/rest/v1/photos"] = lambda r: httpx.Response(201, json=[])
+    spool = io.BytesIO(b"image")
+
+    await main.persist_photo(
+        supabase,
+        http_client,
+        storage,
+        None,
+        "uploads/x.jpg",
+        spool,
+        "image/jpeg",
+        5,
+        NEW_PHOTO,
+    )
+
+    assert spool.closed
+    methods = [r.method for r in fake_supabase.calls("/uploads/x.jpg")]
+    assert methods == ["POST", "DELETE"]